@@ -10,13 +10,21 @@ Features:
  - Rate-limiting (per-user)
  - Robust logging and error handling
  - Config via environment vars or .env
+ - Webhook mode when WEBHOOK_URL is set, long-polling otherwise
 """
 
 import os
 import asyncio
+import functools
+import html
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import logging.handlers
+import queue
+import time
+import warnings
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 import aiosqlite
@@ -25,28 +33,53 @@ from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    ChatAction,
-    InputFile,
 )
-from telegram.constants import ParseMode
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import Forbidden, TelegramError
+from telegram.warnings import PTBUserWarning
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     ContextTypes,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     filters,
     ConversationHandler,
+    TypeHandler,
 )
 
+@dataclass(frozen=True)
+class Config:
+    """Startup configuration, read once from the environment (or .env)."""
+
+    token: str = field(repr=False)
+    admin_id: int
+    database_path: str
+    # Webhook mode is used when webhook_url is set; otherwise we fall back to polling.
+    webhook_url: Optional[str]
+    port: int
+    # None keeps PTB's own default (256 connections for the bot request pool)
+    connection_pool_size: Optional[int]
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        token = os.getenv("BOT_TOKEN")
+        if not token:
+            raise RuntimeError("BOT_TOKEN not set in environment")
+        return cls(
+            token=token,
+            admin_id=int(os.getenv("ADMIN_ID") or 0),
+            database_path=os.getenv("DATABASE_PATH", "bot_data.db"),
+            webhook_url=os.getenv("WEBHOOK_URL") or None,
+            port=int(os.getenv("PORT") or 8443),
+            connection_pool_size=int(os.getenv("CONNECTION_POOL_SIZE") or 0) or None,
+        )
+
+
 # Load env
 load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-ADMIN_ID = int(os.getenv("ADMIN_ID") or 0)
-DATABASE_PATH = os.getenv("DATABASE_PATH", "bot_data.db")
-
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN not set in environment")
+CONFIG = Config.from_env()
 
 # Logging
 logging.basicConfig(
@@ -54,10 +87,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiting: max messages per interval
+
+def start_log_listener() -> logging.handlers.QueueListener:
+    """
+    Move the root handlers behind a QueueListener so the stderr writes happen on
+    the listener thread. Records are still formatted (tracebacks included) by
+    QueueHandler.prepare() on the calling thread.
+    """
+    root = logging.getLogger()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    return listener
+
+# Rate limiting: per-user token bucket allowing bursts of RATE_LIMIT_COUNT,
+# refilled at RATE_LIMIT_COUNT per RATE_LIMIT_INTERVAL seconds
 RATE_LIMIT_COUNT = 5
-RATE_LIMIT_INTERVAL = timedelta(seconds=10)
-_user_message_times: Dict[int, list] = {}
+RATE_LIMIT_INTERVAL = 10.0
+RATE_LIMIT_REFILL = RATE_LIMIT_COUNT / RATE_LIMIT_INTERVAL
+_user_buckets: Dict[int, Tuple[float, float]] = {}  # user_id -> (tokens, last refill)
+# A bucket untouched for RATE_LIMIT_INTERVAL is full again, same as a missing one
+RATE_LIMIT_SWEEP_INTERVAL = 300.0
+_last_bucket_sweep = time.monotonic()
+
+# Broadcast pacing: Telegram allows ~30 messages/s per bot
+BROADCAST_BATCH_SIZE = 25
+BROADCAST_BATCH_INTERVAL = 1.0
+
+# Message filters shared by several handlers
+TEXT_NO_COMMAND = filters.TEXT & ~filters.COMMAND
+ANY_NO_COMMAND = filters.ALL & ~filters.COMMAND
 
 # Conversation states
 (
@@ -66,159 +126,347 @@ _user_message_times: Dict[int, list] = {}
 ) = range(2)
 
 # Helpers - database
-async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                joined_at TEXT
-            );
-            """
-        )
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS banned (
-                user_id INTEGER PRIMARY KEY,
-                reason TEXT,
-                banned_at TEXT
-            );
-            """
-        )
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                text TEXT,
-                created_at TEXT
-            );
-            """
+# One long-lived connection shared by every handler (opened in on_startup).
+_db: Optional[aiosqlite.Connection] = None
+# Writers share that connection's transaction; this lock keeps each
+# write + commit (or rollback) from interleaving with another.
+_db_write_lock = asyncio.Lock()
+
+# WAL lets readers run alongside the writer and, with synchronous=NORMAL,
+# commits no longer fsync twice. The rest are per-connection tuning.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    joined_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS banned (
+    user_id INTEGER PRIMARY KEY,
+    reason TEXT,
+    banned_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    text TEXT,
+    created_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS broadcast_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    ok INTEGER,
+    created_at INTEGER
+);
+-- banned.user_id is the primary key already; messages needs its own index
+CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id, created_at DESC);
+"""
+
+# Write statements, defined once here rather than repeated at each call site.
+# Upserts update in place, keeping the rowid and the original joined_at.
+INSERT_USER_SQL = (
+    "INSERT INTO users (user_id, username, first_name, last_name, joined_at) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, "
+    "first_name = excluded.first_name, last_name = excluded.last_name"
+)
+INSERT_BANNED_SQL = (
+    "INSERT INTO banned (user_id, reason, banned_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET reason = excluded.reason, banned_at = excluded.banned_at"
+)
+INSERT_MESSAGE_SQL = "INSERT INTO messages (user_id, text, created_at) VALUES (?, ?, ?)"
+INSERT_BROADCAST_LOG_SQL = "INSERT INTO broadcast_log (user_id, ok, created_at) VALUES (?, ?, ?)"
+
+
+async def open_db():
+    global _db
+    _db = await aiosqlite.connect(CONFIG.database_path)
+    for pragma in SQLITE_PRAGMAS:
+        await _db.execute(pragma)
+
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.execute("PRAGMA optimize")
+        await _db.close()
+        _db = None
+
+
+# Message log queue, drained by _message_writer (started in on_startup)
+MESSAGE_FLUSH_INTERVAL = 0.5
+MESSAGE_FLUSH_MAX_BATCH = 500
+MESSAGE_QUEUE_MAXSIZE = 10000
+_message_queue: asyncio.Queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_MAXSIZE)
+_message_writer_task: Optional[asyncio.Task] = None
+
+# Mirror of the banned table, loaded on startup and kept in sync by ban/unban
+_banned_ids: Set[int] = set()
+
+
+def get_db() -> aiosqlite.Connection:
+    if _db is None:
+        raise RuntimeError("Database connection is not open")
+    return _db
+
+
+async def _write(sql: str, params=(), many: bool = False):
+    """Run one write and commit it; on failure roll back only this write."""
+    db = get_db()
+    async with _db_write_lock:
+        try:
+            if many:
+                await db.executemany(sql, params)
+            else:
+                await db.execute(sql, params)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+# Timestamp columns stored as INTEGER epoch seconds; older databases have them as TEXT
+TIMESTAMP_COLUMNS = {
+    "users": "joined_at",
+    "banned": "banned_at",
+    "messages": "created_at",
+    "broadcast_log": "created_at",
+}
+
+
+async def _legacy_timestamp_tables(db: aiosqlite.Connection) -> Dict[str, list]:
+    """Return {table: column names} for existing tables whose timestamp column isn't INTEGER."""
+    legacy = {}
+    for table, column in TIMESTAMP_COLUMNS.items():
+        async with db.execute(f"PRAGMA table_info({table})") as cur:
+            columns = {row[1]: row[2] async for row in cur}
+        if column in columns and columns[column].upper() != "INTEGER":
+            legacy[table] = list(columns)
+    return legacy
+
+
+def _migration_script(legacy: Dict[str, list]) -> str:
+    # Rebuild each legacy table under the new schema in one transaction.
+    # ISO strings are converted; numeric text (epoch written into a TEXT column) is cast as is.
+    steps = ["BEGIN;", "DROP INDEX IF EXISTS idx_messages_user;"]
+    steps += [f"ALTER TABLE {table} RENAME TO {table}_legacy;" for table in legacy]
+    steps.append(SCHEMA_SQL)
+    for table, columns in legacy.items():
+        ts = TIMESTAMP_COLUMNS[table]
+        select = [
+            f"CASE WHEN typeof({c}) = 'text' AND {c} LIKE '%-%' "
+            f"THEN CAST(strftime('%s', {c}) AS INTEGER) ELSE CAST({c} AS INTEGER) END"
+            if c == ts else c
+            for c in columns
+        ]
+        steps.append(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(select)} FROM {table}_legacy;"
         )
-        await db.commit()
+        steps.append(f"DROP TABLE {table}_legacy;")
+    steps.append("COMMIT;")
+    return "\n".join(steps)
+
+
+async def init_db():
+    db = get_db()
+    legacy = await _legacy_timestamp_tables(db)
+    if legacy:
+        logger.info("Converting timestamps to epoch seconds in: %s", ", ".join(legacy))
+        await db.executescript(_migration_script(legacy))
+    await db.executescript(SCHEMA_SQL)
     logger.info("Database initialized.")
 
 
 async def add_user(user):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            """
-            INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, joined_at)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                user.id,
-                getattr(user, "username", None),
-                getattr(user, "first_name", None),
-                getattr(user, "last_name", None),
-                datetime.utcnow().isoformat(),
-            ),
-        )
-        await db.commit()
+    await _write(
+        INSERT_USER_SQL,
+        (
+            user.id,
+            getattr(user, "username", None),
+            getattr(user, "first_name", None),
+            getattr(user, "last_name", None),
+            int(time.time()),
+        ),
+    )
+
 
+async def load_banned():
+    async with get_db().execute("SELECT user_id FROM banned") as cur:
+        _banned_ids.clear()
+        _banned_ids.update([row[0] async for row in cur])
+    logger.info("Loaded %d banned users.", len(_banned_ids))
 
-async def is_banned(user_id: int) -> bool:
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute("SELECT 1 FROM banned WHERE user_id = ?", (user_id,))
-        row = await cur.fetchone()
-        return row is not None
+
+def is_banned(user_id: int) -> bool:
+    # banned is tiny and near-static; checked on every update, so keep it in memory
+    return user_id in _banned_ids
 
 
 async def ban_user(user_id: int, reason: str = ""):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            "INSERT OR REPLACE INTO banned (user_id, reason, banned_at) VALUES (?, ?, ?)",
-            (user_id, reason, datetime.utcnow().isoformat()),
-        )
-        await db.commit()
+    await _write(INSERT_BANNED_SQL, (user_id, reason, int(time.time())))
+    _banned_ids.add(user_id)
 
 
 async def unban_user(user_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("DELETE FROM banned WHERE user_id = ?", (user_id,))
-        await db.commit()
+    await _write("DELETE FROM banned WHERE user_id = ?", (user_id,))
+    _banned_ids.discard(user_id)
 
 
-async def log_message(user_id: int, text: str):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            "INSERT INTO messages (user_id, text, created_at) VALUES (?, ?, ?)",
-            (user_id, text, datetime.utcnow().isoformat()),
-        )
-        await db.commit()
+def log_message(user_id: int, text: str):
+    # only enqueue; _message_writer batches the INSERTs into one transaction
+    try:
+        _message_queue.put_nowait((user_id, text, int(time.time())))
+    except asyncio.QueueFull:
+        # the writer is behind; drop the row rather than let memory grow unbounded
+        logger.warning("Message log queue full, dropping message from %s", user_id)
+
+
+async def _message_writer():
+    stopping = False
+    while not stopping:
+        batch = [await _message_queue.get()]
+        # let a burst accumulate so it lands in a single commit
+        await asyncio.sleep(MESSAGE_FLUSH_INTERVAL)
+        while not _message_queue.empty() and len(batch) < MESSAGE_FLUSH_MAX_BATCH:
+            batch.append(_message_queue.get_nowait())
+        if None in batch:
+            stopping = True
+            batch = [row for row in batch if row is not None]
+        if not batch:
+            continue
+        try:
+            await _write(INSERT_MESSAGE_SQL, batch, many=True)
+        except Exception:
+            logger.exception("Failed to write %d logged messages", len(batch))
+
+
+def start_message_writer():
+    global _message_writer_task
+    _message_writer_task = asyncio.create_task(_message_writer())
+
+
+async def stop_message_writer():
+    global _message_writer_task
+    if _message_writer_task is None:
+        return
+    # sentinel: the writer flushes everything queued before it, then exits.
+    # put() waits for room if the queue happens to be full.
+    await _message_queue.put(None)
+    await _message_writer_task
+    _message_writer_task = None
 
 
 # Rate limiting helper
+def _sweep_idle_buckets(now: float):
+    global _last_bucket_sweep
+    _last_bucket_sweep = now
+    idle = [uid for uid, (_, last) in _user_buckets.items() if now - last >= RATE_LIMIT_INTERVAL]
+    for uid in idle:
+        del _user_buckets[uid]
+
+
 def is_rate_limited(user_id: int) -> bool:
-    now = datetime.utcnow()
-    times = _user_message_times.get(user_id, [])
-    # keep only recent timestamps
-    times = [t for t in times if now - t < RATE_LIMIT_INTERVAL]
-    times.append(now)
-    _user_message_times[user_id] = times
-    return len(times) > RATE_LIMIT_COUNT
-
-
-# UI helpers
-def main_menu_keyboard():
-    keyboard = [
+    now = time.monotonic()
+    # drop idle users now and then so the dict only holds recently active ones
+    if now - _last_bucket_sweep >= RATE_LIMIT_SWEEP_INTERVAL:
+        _sweep_idle_buckets(now)
+    tokens, last = _user_buckets.get(user_id, (RATE_LIMIT_COUNT, now))
+    tokens = min(RATE_LIMIT_COUNT, tokens + (now - last) * RATE_LIMIT_REFILL)
+    if tokens < 1:
+        _user_buckets[user_id] = (tokens, now)
+        return True
+    _user_buckets[user_id] = (tokens - 1, now)
+    return False
+
+
+# Texts
+START_TEXT = (
+    "नमस्ते, {mention}!\n\n"
+    "मैं आपका professional bot हूँ — नीचे दिए गए मेनू से शुरू करें।\n\n"
+    "<b>Quick commands</b>:\n"
+    "/help — जानकारी\n"
+    "/about — bot के बारे में\n"
+)
+HELP_TEXT = (
+    "याद रखने योग्य कमांड्स:\n"
+    "/start — शुरू करें\n"
+    "/help — यह मैसेज\n"
+    "/about — bot जानकारी\n"
+    "/contact — मेरे साथ संपर्क करें\n"
+)
+ABOUT_TEXT = (
+    "<b>Professional Bot</b>\n"
+    "Version: 1.0\n"
+    "Features: polished UI, sqlite persistence, admin tools, and more.\n"
+)
+BANNED_TEXT = "आपको अस्थायी रूप से निषिद्ध कर दिया गया है। अधिक जानकारी के लिए admin से संपर्क करें।"
+CONTACT_ASK_NAME_TEXT = "कृपया अपना नाम भेजें (या /cancel):"
+
+
+# UI - markups are immutable, so build them once and share them
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup(
+    [
         [InlineKeyboardButton("📣 About", callback_data="about")],
         [InlineKeyboardButton("📝 Contact / Support", callback_data="contact")],
         [InlineKeyboardButton("⚙️ Settings", callback_data="settings")],
     ]
-    return InlineKeyboardMarkup(keyboard)
-
+)
 
-def settings_keyboard():
-    keyboard = [
+SETTINGS_KEYBOARD = InlineKeyboardMarkup(
+    [
         [InlineKeyboardButton("🔔 Subscribe", callback_data="subscribe")],
         [InlineKeyboardButton("🔕 Unsubscribe", callback_data="unsubscribe")],
         [InlineKeyboardButton("◀️ Back", callback_data="back_main")],
     ]
-    return InlineKeyboardMarkup(keyboard)
+)
 
 
-# Command handlers
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Pre-processing (group -1): runs before every other handler
+async def ban_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    if await is_banned(user.id):
-        await update.effective_message.reply_text(
-            "आपको अस्थायी रूप से निषिद्ध कर दिया गया है। अधिक जानकारी के लिए admin से संपर्क करें।"
-        )
+    # the admin is never gated, so an accidental self-ban can still be undone
+    if user is None or user.id == CONFIG.admin_id or not is_banned(user.id):
         return
+    try:
+        if update.callback_query is not None:
+            # stop the client's loading spinner on the pressed button
+            await update.callback_query.answer()
+        message = update.effective_message
+        if message is not None and message.text and message.text.startswith("/"):
+            await message.reply_text(BANNED_TEXT)
+    except TelegramError as e:
+        # a failed reply must not let the update fall through to group 0
+        logger.warning("Could not notify banned user %s: %s", user.id, e)
+    # banned users never reach the regular handlers
+    raise ApplicationHandlerStop
+
 
+# Command handlers
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
     await add_user(user)
-    text = (
-        f"नमस्ते, {user.mention_html()}!\n\n"
-        "मैं आपका professional bot हूँ — नीचे दिए गए मेनू से शुरू करें।\n\n"
-        "<b>Quick commands</b>:\n"
-        "/help — जानकारी\n"
-        "/about — bot के बारे में\n"
-    )
-    await update.effective_message.reply_html(text, reply_markup=main_menu_keyboard())
+    text = START_TEXT.format(mention=user.mention_html())
+    await update.effective_message.reply_html(text, reply_markup=MAIN_MENU_KEYBOARD)
 
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    txt = (
-        "याद रखने योग्य कमांड्स:\n"
-        "/start — शुरू करें\n"
-        "/help — यह मैसेज\n"
-        "/about — bot जानकारी\n"
-        "/contact — मेरे साथ संपर्क करें\n"
-    )
-    await update.effective_message.reply_text(txt)
+    await update.effective_message.reply_text(HELP_TEXT)
 
 
 async def about_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    txt = (
-        "<b>Professional Bot</b>\n"
-        "Version: 1.0\n"
-        "Features: polished UI, sqlite persistence, admin tools, and more.\n"
-    )
-    await update.effective_message.reply_html(txt)
+    await update.effective_message.reply_html(ABOUT_TEXT)
 
 
 # CallbackQuery
@@ -234,21 +482,21 @@ async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "यह एक demonstration bot है — professional features के साथ।"
             ),
             parse_mode=ParseMode.HTML,
-            reply_markup=main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
     elif data == "contact":
-        await query.edit_message_text("कृपया अपना नाम भेजें (या /cancel):")
+        await query.edit_message_text(CONTACT_ASK_NAME_TEXT)
         return await start_contact_flow(query, context)
     elif data == "settings":
         await query.edit_message_text(
-            "Settings:", reply_markup=settings_keyboard()
+            "Settings:", reply_markup=SETTINGS_KEYBOARD
         )
     elif data == "subscribe":
-        await query.edit_message_text("आप अब सब्सक्राइब्ड हैं ✅\nBack to menu:", reply_markup=main_menu_keyboard())
+        await query.edit_message_text("आप अब सब्सक्राइब्ड हैं ✅\nBack to menu:", reply_markup=MAIN_MENU_KEYBOARD)
     elif data == "unsubscribe":
-        await query.edit_message_text("आपने अनसब्सक्राइब कर दिया है 🔕\nBack to menu:", reply_markup=main_menu_keyboard())
+        await query.edit_message_text("आपने अनसब्सक्राइब कर दिया है 🔕\nBack to menu:", reply_markup=MAIN_MENU_KEYBOARD)
     elif data == "back_main":
-        await query.edit_message_text("मुख्य मेनू:", reply_markup=main_menu_keyboard())
+        await query.edit_message_text("मुख्य मेनू:", reply_markup=MAIN_MENU_KEYBOARD)
     else:
         await query.edit_message_text("Unknown action. Try /help")
 
@@ -265,11 +513,7 @@ async def start_contact_flow(query_or_update, context: ContextTypes.DEFAULT_TYPE
 
 
 async def contact_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if await is_banned(update.effective_user.id):
-        await update.message.reply_text("You are banned and cannot contact.")
-        return ConversationHandler.END
-
-    await update.message.reply_text("कृपया अपना नाम भेजें (या /cancel):")
+    await update.message.reply_text(CONTACT_ASK_NAME_TEXT)
     return CONTACT_NAME
 
 
@@ -284,7 +528,7 @@ async def contact_message_received(update: Update, context: ContextTypes.DEFAULT
     text = update.message.text.strip()
     user = update.effective_user
     # Log message
-    await log_message(user.id, text)
+    log_message(user.id, text)
     # Send to admin
     admin_text = (
         f"📨 New contact message\n"
@@ -294,10 +538,12 @@ async def contact_message_received(update: Update, context: ContextTypes.DEFAULT
         f"At: {datetime.utcnow().isoformat()}Z"
     )
     try:
-        if ADMIN_ID:
-            await context.bot.send_message(chat_id=ADMIN_ID, text=admin_text, parse_mode=ParseMode.HTML)
-    except Exception as e:
-        logger.exception("Failed to notify admin: %s", e)
+        if CONFIG.admin_id:
+            await context.bot.send_message(chat_id=CONFIG.admin_id, text=admin_text, parse_mode=ParseMode.HTML)
+    except TelegramError as e:
+        logger.warning("Failed to notify admin: %s", e)
+    except Exception:
+        logger.exception("Failed to notify admin.")
     await update.message.reply_text("धन्यवाद! हमने आपका संदेश प्राप्त कर लिया है।")
     context.user_data.pop("contact_name", None)
     return ConversationHandler.END
@@ -310,10 +556,11 @@ async def contact_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Admin commands
-async def admin_only(func):
+def admin_only(func):
+    @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         uid = update.effective_user.id
-        if uid != ADMIN_ID:
+        if uid != CONFIG.admin_id:
             await update.effective_message.reply_text("This command is for admin only.")
             return
         return await func(update, context)
@@ -322,14 +569,47 @@ async def admin_only(func):
 
 @admin_only
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute("SELECT COUNT(*) FROM users")
+    db = get_db()
+    async with db.execute("SELECT COUNT(*) FROM users") as cur:
         users_count = (await cur.fetchone())[0]
-        cur = await db.execute("SELECT COUNT(*) FROM messages")
+    async with db.execute("SELECT COUNT(*) FROM messages") as cur:
         messages_count = (await cur.fetchone())[0]
     await update.effective_message.reply_text(f"Users: {users_count}\nMessages logged: {messages_count}")
 
 
+async def _broadcast_batch(bot, user_ids, text: str):
+    """Send one batch concurrently and record delivery; returns (sent, failed)."""
+    results = await asyncio.gather(
+        *(bot.send_message(chat_id=user_id, text=text) for user_id in user_ids),
+        return_exceptions=True,
+    )
+    sent = 0
+    failed = 0
+    created_at = int(time.time())
+    delivery_rows = []
+    for user_id, result in zip(user_ids, results):
+        ok = not isinstance(result, Exception)
+        delivery_rows.append((user_id, int(ok), created_at))
+        if ok:
+            sent += 1
+            continue
+        failed += 1
+        if isinstance(result, Forbidden):
+            # user blocked the bot - expected, no traceback needed
+            logger.info("Broadcast to %s skipped: bot blocked", user_id)
+        elif isinstance(result, TelegramError):
+            logger.warning("Broadcast to %s failed: %s", user_id, result)
+        else:
+            logger.error("Broadcast to %s failed", user_id, exc_info=result)
+    # one transaction per batch rather than per recipient
+    try:
+        await _write(INSERT_BROADCAST_LOG_SQL, delivery_rows, many=True)
+    except Exception:
+        # bookkeeping only; the batch is already sent, so keep broadcasting
+        logger.exception("Failed to record delivery for %d broadcast recipients", len(delivery_rows))
+    return sent, failed
+
+
 @admin_only
 async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Usage: /broadcast Your message here
@@ -338,23 +618,31 @@ async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("Usage: /broadcast <message>")
         return
     text = " ".join(args)
-    # fetch users
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cur = await db.execute("SELECT user_id FROM users")
-        rows = await cur.fetchall()
-    if not rows:
-        await update.effective_message.reply_text("No users to broadcast.")
-        return
     sent = 0
     failed = 0
-    for (user_id,) in rows:
-        try:
-            await context.bot.send_message(chat_id=user_id, text=text)
-            sent += 1
-            await asyncio.sleep(0.05)  # small throttle
-        except Exception:
-            failed += 1
-            logger.exception("Broadcast to %s failed", user_id)
+    batches = 0
+    last_id = 0  # Telegram user ids are positive
+    db = get_db()
+    while True:
+        # keyset pages: no read statement stays open across the sends and
+        # sleeps, which would keep SQLite from resetting the WAL meanwhile
+        async with db.execute(
+            "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (last_id, BROADCAST_BATCH_SIZE),
+        ) as cur:
+            batch = [user_id for (user_id,) in await cur.fetchall()]
+        if not batch:
+            break
+        last_id = batch[-1]
+        if batches:
+            await asyncio.sleep(BROADCAST_BATCH_INTERVAL)
+        ok, bad = await _broadcast_batch(context.bot, batch, text)
+        sent += ok
+        failed += bad
+        batches += 1
+    if not batches:
+        await update.effective_message.reply_text("No users to broadcast.")
+        return
     await update.effective_message.reply_text(f"Broadcast complete. Sent: {sent}, Failed: {failed}")
 
 
@@ -394,15 +682,12 @@ async def cmd_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Generic message handler (rate-limiting & logging)
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    if await is_banned(user.id):
-        # ignore messages from banned users
-        return
     if is_rate_limited(user.id):
         await update.message.reply_text("You're sending messages too fast. Please slow down.")
         return
     # log text (if any)
     if update.message.text:
-        await log_message(user.id, update.message.text)
+        log_message(user.id, update.message.text)
     # simple echo/helpful reply
     await update.message.reply_text(
         "मैं आपकी मदद के लिए यहाँ हूँ — /help टाइप करें या मेनू खोलने के लिए /start दबाएँ."
@@ -410,39 +695,85 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Error handler
-async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
-    logger.exception("Error while handling an update: %s", context.error)
-    # Notify admin
+# Strong references to fire-and-forget tasks so they are not garbage-collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+
+ERROR_TEXT_LIMIT = 1000  # leaves the rest of the message for the Update repr
+
+
+def _html_snippet(value, limit: int) -> str:
+    """HTML-escape str(value) and cut it to at most limit characters."""
+    text = html.escape(str(value))
+    if len(text) <= limit:
+        return text
+    text = text[:limit - 1]
+    # don't leave half an entity such as "&am" behind
+    amp = text.rfind("&")
+    if amp > text.rfind(";"):
+        text = text[:amp]
+    return text + "…"
+
+
+async def _notify_admin_of_error(bot, text: str):
     try:
-        if ADMIN_ID:
-            text = (
-                f"⚠️ <b>Exception</b>\n"
-                f"{context.error}\n"
-                f"Update: {update}"
-            )
-            await context.bot.send_message(chat_id=ADMIN_ID, text=text, parse_mode=ParseMode.HTML)
+        await bot.send_message(chat_id=CONFIG.admin_id, text=text, parse_mode=ParseMode.HTML)
     except Exception:
         logger.exception("Failed to notify admin about error.")
 
 
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    # not inside an except block, so pass the stored error explicitly
+    logger.error("Error while handling an update: %s", context.error, exc_info=context.error)
+    # Notify admin without holding up the update on a Telegram round-trip
+    if CONFIG.admin_id:
+        error = _html_snippet(context.error, ERROR_TEXT_LIMIT)
+        head = f"⚠️ <b>Exception</b>\n{error}\nUpdate: "
+        text = head + _html_snippet(update, MessageLimit.MAX_TEXT_LENGTH - len(head))
+        task = asyncio.create_task(_notify_admin_of_error(context.bot, text))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
 # Startup / Shutdown
 async def on_startup(app):
     logger.info("Bot starting up...")
+    await open_db()
     await init_db()
+    await load_banned()
+    start_message_writer()
 
 
 async def on_shutdown(app):
     logger.info("Bot shutting down...")
+    # the bot is already shut down here, so pending admin notifications can't be sent
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await stop_message_writer()
+    await close_db()
 
 
 def build_app():
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+    builder = (
+        ApplicationBuilder()
+        .token(CONFIG.token)
+        # wait longer for a free connection during broadcast bursts
+        .pool_timeout(30)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if CONFIG.connection_pool_size:
+        builder = builder.connection_pool_size(CONFIG.connection_pool_size)
+    application = builder.build()
+
+    # Ban check ahead of everything else
+    application.add_handler(TypeHandler(Update, ban_gate), group=-1)
 
     # Basic commands
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_cmd))
     application.add_handler(CommandHandler("about", about_cmd))
-    application.add_handler(CommandHandler("contact", contact_command))
 
     # Admin commands
     application.add_handler(CommandHandler("stats", cmd_stats))
@@ -450,24 +781,35 @@ def build_app():
     application.add_handler(CommandHandler("ban", cmd_ban))
     application.add_handler(CommandHandler("unban", cmd_unban))
 
+    # Conversation for contact (registered before the menu router so the
+    # "contact" button and /contact actually enter the conversation).
+    # Tracking per chat and user (per_message=False) is intended: the button
+    # only enters the conversation and the rest is plain text, so PTB's
+    # per_message warning about the CallbackQueryHandler doesn't apply.
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            "ignore", message="If 'per_message=False'", category=PTBUserWarning
+        )
+        conv = ConversationHandler(
+            entry_points=[
+                CommandHandler("contact", contact_command),
+                CallbackQueryHandler(callback_router, pattern="^contact$"),
+            ],
+            states={
+                CONTACT_NAME: [MessageHandler(TEXT_NO_COMMAND, contact_name_received)],
+                CONTACT_MESSAGE: [MessageHandler(TEXT_NO_COMMAND, contact_message_received)],
+            },
+            fallbacks=[CommandHandler("cancel", contact_cancel)],
+            name="contact_conv",
+            persistent=False,
+        )
+    application.add_handler(conv)
+
     # Callback queries (menus)
     application.add_handler(CallbackQueryHandler(callback_router))
 
-    # Conversation for contact
-    conv = ConversationHandler(
-        entry_points=[CommandHandler("contact", contact_command)],
-        states={
-            CONTACT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, contact_name_received)],
-            CONTACT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, contact_message_received)],
-        },
-        fallbacks=[CommandHandler("cancel", contact_cancel)],
-        name="contact_conv",
-        persistent=False,
-    )
-    application.add_handler(conv)
-
     # Generic message handler
-    application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, message_handler))
+    application.add_handler(MessageHandler(ANY_NO_COMMAND, message_handler))
 
     # Errors
     application.add_error_handler(error_handler)
@@ -475,26 +817,36 @@ def build_app():
     return application
 
 
-async def main():
+def main():
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        # libuv-backed loop; PTB picks it up through the standard asyncio API
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     app = build_app()
-    app.post_init = on_startup
-    app.stop_signals = ( )
-    # start
-    await app.initialize()
-    await app.start()
-    logger.info("Bot started — polling.")
-    # Use polling for simplicity. For production you may want webhooks.
-    await app.updater.start_polling()
-    # idle waits until signal; since we don't rely on signals here, use idle()
-    await app.updater.idle()
-    # shutdown
-    await app.stop()
-    await app.shutdown()
+    if CONFIG.webhook_url:
+        # Telegram pushes updates to us; no getUpdates long-poll round-trips.
+        logger.info("Bot started — webhook on port %s.", CONFIG.port)
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=CONFIG.port,
+            url_path=CONFIG.token,
+            webhook_url=f"{CONFIG.webhook_url.rstrip('/')}/{CONFIG.token}",
+        )
+    else:
+        logger.info("Bot started — polling.")
+        app.run_polling()
     logger.info("Bot stopped.")
 
 
 if __name__ == "__main__":
+    log_listener = start_log_listener()
     try:
-        asyncio.run(main())
+        main()
     except (KeyboardInterrupt, SystemExit):
         logger.info("Exiting...")
+    finally:
+        # stopped after the last log call so every queued record is flushed
+        log_listener.stop()
@@ -1,6 +1,5 @@
 # imghdr fallback using Pillow
 from io import BytesIO
-from PIL import Image
 
 def what(file, h=None):
     """
@@ -39,7 +38,23 @@ def what(file, h=None):
     if not data:
         return None
 
+    # common formats by magic bytes; no need to build a PIL image
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:2] == b'BM':
+        return 'bmp'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[4:12] in (b'ftypheic', b'ftypheix', b'ftyphevc', b'ftypmif1'):
+        return 'heic'
+
+    # anything else: let Pillow identify it (imported only when needed)
     try:
+        from PIL import Image
         img = Image.open(BytesIO(data))
         fmt = img.format
         if not fmt: